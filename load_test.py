@@ -0,0 +1,382 @@
+"""Offline load test for main.py.
+
+Swaps the Telethon client and the DB helpers for in-process fakes *before*
+main.py is imported, then drives the registered handlers with fake events:
+every simulated user sends a file, walks the text menu and fires a
+conversion, exactly like a real chat would.  No network is touched.
+
+    python load_test.py --sessions 2000 --concurrency 200
+    python load_test.py --fixtures ./my_files --latency 50
+
+Reports p50/p95/p99 latency per step, event-loop lag, RSS growth and
+temp-disk growth.
+"""
+import os, sys, asyncio, tempfile, time, shutil, argparse, random, resource, zipfile, wave, math
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Tuple, Callable
+
+# ---------------- FAKE TELEGRAM ----------------
+@dataclass
+class FakeFile:
+    name: Optional[str]
+    attributes: list = field(default_factory=list)
+
+
+@dataclass
+class FakeMessage:
+    raw_text: str = ""
+    file: Optional[FakeFile] = None
+    fixture_path: Optional[str] = None  # local file served by download_media
+
+
+class FakeEvent:
+    """Just enough of telethon's NewMessage.Event for main.py's handlers."""
+
+    def __init__(self, client, chat_id: int, sender_id: int, message: FakeMessage):
+        self.client = client
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.message = message
+        self.raw_text = message.raw_text
+        self.file = message.file
+        self.pattern_match = None
+        self.replies: List[str] = []
+        self.error_replies = 0
+
+    async def respond(self, text, **kwargs):
+        await self.client._net_delay()
+        self.client.responses += 1
+        self.replies.append(text)
+        # run_wrapper & co. catch failures and answer "❌ Error: ..." (the
+        # ffmpeg-missing notice starts with ❌ too), so count those as errors
+        if str(text).startswith("❌"):
+            self.error_replies += 1
+
+
+class FakeClient:
+    """Stand-in for TelegramClient: records handlers, serves downloads from
+    local fixtures and swallows uploads."""
+
+    def __init__(self, *args, **kwargs):
+        self.handlers: List[Tuple[object, Callable]] = []
+        self.latency = 0.0
+        self.responses = 0
+        self.sent_files = 0
+        self.sent_bytes = 0
+        self.messages = 0
+
+    def start(self, *args, **kwargs):
+        return self
+
+    def on(self, builder):
+        def decorator(fn):
+            self.handlers.append((builder, fn))
+            return fn
+        return decorator
+
+    async def _net_delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+
+    async def download_media(self, msg, file=None):
+        await self._net_delay()
+        await asyncio.to_thread(shutil.copyfile, msg.fixture_path, file)
+        return file
+
+    async def send_file(self, entity, path, **kwargs):
+        await self._net_delay()
+        self.sent_files += 1
+        if isinstance(path, str) and os.path.exists(path):
+            self.sent_bytes += os.path.getsize(path)
+
+    async def send_message(self, entity, text, **kwargs):
+        await self._net_delay()
+        self.messages += 1
+
+    def run_until_disconnected(self):
+        pass
+
+
+def _matches(builder, event) -> bool:
+    # Mirrors the NewMessage filters main.py relies on: pattern then func.
+    pattern = getattr(builder, "pattern", None)
+    if pattern:
+        m = pattern(event.raw_text or "")
+        if not m:
+            return False
+        event.pattern_match = m
+    func = getattr(builder, "func", None)
+    if func and not func(event):
+        return False
+    return True
+
+
+async def dispatch(client: FakeClient, event: FakeEvent) -> int:
+    """Run every matching handler in registration order, like telethon does.
+    Returns the number of errors: handlers that raised plus ❌ replies."""
+    errors = 0
+    for builder, fn in client.handlers:
+        if not _matches(builder, event):
+            continue
+        try:
+            await fn(event)
+        except Exception:
+            errors += 1
+    return errors + event.error_replies
+
+
+def load_bot(workdir: str):
+    """Import main.py against the fakes with its temp files under workdir."""
+    import telethon
+    import db
+    telethon.TelegramClient = FakeClient
+    db.init_db = lambda: None
+    db.add_user = lambda user_id: None
+    db.get_all_users = lambda: []
+    tempfile.tempdir = workdir
+    import main
+    return main
+
+# ---------------- FIXTURES ----------------
+
+def make_fixtures(dest: str) -> Dict[str, str]:
+    """Build a small default fixture set; video needs a user-supplied file."""
+    from PIL import Image
+    from PyPDF2 import PdfWriter
+
+    os.makedirs(dest, exist_ok=True)
+    out = {}
+
+    p = os.path.join(dest, "photo.png")
+    Image.new("RGB", (1280, 720), (30, 120, 200)).save(p, "PNG")
+    out["image"] = p
+
+    p = os.path.join(dest, "doc.pdf")
+    writer = PdfWriter()
+    for _ in range(5):
+        writer.add_blank_page(width=595, height=842)
+    with open(p, "wb") as f:
+        writer.write(f)
+    out["pdf"] = p
+
+    p = os.path.join(dest, "bundle.zip")
+    with zipfile.ZipFile(p, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.write(out["image"], "photo.png")
+        zf.write(out["pdf"], "doc.pdf")
+    out["zip"] = p
+
+    p = os.path.join(dest, "tone.wav")
+    with wave.open(p, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(22050)
+        w.writeframes(b"\x00\x10" * 22050 * 2)
+    out["audio"] = p
+    return out
+
+
+def find_fixtures(src: str) -> Dict[str, str]:
+    """Pick one file per kind out of a user directory, by extension."""
+    kinds = {
+        "image": (".png", ".jpg", ".jpeg", ".webp"),
+        "pdf": (".pdf",),
+        "zip": (".zip",),
+        "audio": (".wav", ".mp3", ".ogg", ".m4a"),
+        "video": (".mp4", ".mov", ".mkv", ".webm"),
+    }
+    out = {}
+    for nm in sorted(os.listdir(src)):
+        ext = os.path.splitext(nm)[1].lower()
+        for kind, exts in kinds.items():
+            if ext in exts and kind not in out:
+                out[kind] = os.path.join(src, nm)
+    return out
+
+# ---------------- SCENARIOS ----------------
+# Each step is ("file", fixture_kind) or ("text", message), replayed in order.
+SCENARIOS: Dict[str, List[Tuple[str, str]]] = {
+    "image_png":      [("text", "/start"), ("file", "image"), ("text", "1"), ("text", "1")],
+    "image_jpg":      [("file", "image"), ("text", "1"), ("text", "2")],
+    "image_pdf":      [("file", "image"), ("text", "1"), ("text", "3")],
+    "image_compress": [("file", "image"), ("text", "2"), ("text", "1")],
+    "pdf_resave":     [("file", "pdf"), ("text", "2"), ("text", "3")],
+    "pdf_split":      [("file", "pdf"), ("text", "3"), ("text", "2"), ("text", "1-2,4")],
+    "pdf_text":       [("file", "pdf"), ("text", "3"), ("text", "3")],
+    "pdf_merge":      [("file", "pdf"), ("text", "3"), ("text", "1"),
+                       ("file", "pdf"), ("file", "pdf"), ("text", "done")],
+    "zip_create":     [("file", "image"), ("text", "4"), ("text", "1"),
+                       ("file", "image"), ("file", "pdf"), ("text", "done")],
+    "zip_extract":    [("file", "zip"), ("text", "4"), ("text", "2")],
+    "audio_mp3":      [("file", "audio"), ("text", "1"), ("text", "4")],
+    "menu_cancel":    [("file", "image"), ("text", "1"), ("text", "8"), ("text", "9"), ("text", "/cancel")],
+    "video_mp4":      [("file", "video"), ("text", "1"), ("text", "6")],
+    "video_compress": [("file", "video"), ("text", "2"), ("text", "2")],
+}
+
+
+def usable_scenarios(fixtures: Dict[str, str], only: Optional[List[str]] = None) -> List[str]:
+    names = only or list(SCENARIOS)
+    return [n for n in names
+            if all(kind in fixtures for op, kind in SCENARIOS[n] if op == "file")]
+
+# ---------------- METRICS ----------------
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is KiB on Linux; only a high-water mark, but better than nothing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def dir_bytes(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for nm in files:
+            try:
+                total += os.path.getsize(os.path.join(root, nm))
+            except OSError:
+                pass
+    return total
+
+
+@dataclass
+class Stats:
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+    loop_lag: List[float] = field(default_factory=list)
+    rss_peak: int = 0
+    disk_peak: int = 0
+
+    def record(self, step: str, seconds: float, errors: int):
+        self.latencies.setdefault(step, []).append(seconds)
+        if errors:
+            self.errors[step] = self.errors.get(step, 0) + errors
+
+
+async def monitor(stats: Stats, workdir: str, interval: float, stop: asyncio.Event):
+    """Sample event-loop lag (sleep overshoot), RSS and temp-disk usage."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(max(0.0, time.perf_counter() - t0 - interval))
+        stats.rss_peak = max(stats.rss_peak, rss_bytes())
+        stats.disk_peak = max(stats.disk_peak, await asyncio.to_thread(dir_bytes, workdir))
+
+# ---------------- DRIVER ----------------
+
+async def run_session(client: FakeClient, idx: int, scenario: str, fixtures: Dict[str, str],
+                      stats: Stats, think: float):
+    chat_id = user_id = 10_000 + idx
+    for n, (op, arg) in enumerate(SCENARIOS[scenario]):
+        if op == "file":
+            path = fixtures[arg]
+            msg = FakeMessage(file=FakeFile(os.path.basename(path)), fixture_path=path)
+            label = f"{scenario}[{n}] file:{arg}"
+        else:
+            msg = FakeMessage(raw_text=arg)
+            label = f"{scenario}[{n}] text:{arg}"
+        event = FakeEvent(client, chat_id, user_id, msg)
+        t0 = time.perf_counter()
+        errors = await dispatch(client, event)
+        stats.record(label, time.perf_counter() - t0, errors)
+        if think:
+            await asyncio.sleep(random.uniform(0, think))
+
+
+async def run_load(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    fixdir = tempfile.mkdtemp(prefix="loadtest_fix_")
+    try:
+        fixtures = find_fixtures(args.fixtures) if args.fixtures else make_fixtures(fixdir)
+        main = load_bot(workdir)
+        client = main.client
+        client.latency = args.latency / 1000.0
+
+        names = usable_scenarios(fixtures, args.scenario)
+        if not names:
+            print("❌ No scenario can run with the available fixtures.")
+            return 1
+        if not main.ffmpeg_available():
+            print("⚠️ ffmpeg not found: audio/video scenarios only measure the 'not found' reply.")
+
+        rnd = random.Random(args.seed)
+        stats = Stats()
+        rss0, disk0 = rss_bytes(), dir_bytes(workdir)
+        stop = asyncio.Event()
+        mon = asyncio.create_task(monitor(stats, workdir, args.sample_interval, stop))
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def one(i):
+            async with sem:
+                await run_session(client, i, rnd.choice(names), fixtures, stats, args.think)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.sessions)))
+        wall = time.perf_counter() - t0
+        stop.set()
+        await mon
+
+        rss1, disk1 = rss_bytes(), dir_bytes(workdir)
+        stats.rss_peak = max(stats.rss_peak, rss1)
+        stats.disk_peak = max(stats.disk_peak, disk1)
+        report(args, stats, wall, client, len(main.SESSIONS), rss0, rss1, disk0, disk1)
+        return 0
+    finally:
+        if not args.keep_tmp:
+            shutil.rmtree(workdir, ignore_errors=True)
+        shutil.rmtree(fixdir, ignore_errors=True)
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} MB"
+
+
+def report(args, stats: Stats, wall: float, client: FakeClient, sessions_left: int,
+           rss0: int, rss1: int, disk0: int, disk1: int):
+    ms = lambda v: f"{v * 1000:9.1f}"
+    steps = sum(len(v) for v in stats.latencies.values())
+    print(f"\n📊 {args.sessions} sessions, concurrency {args.concurrency}, "
+          f"{steps} steps in {wall:.1f}s ({steps / wall if wall else 0:.0f} steps/s)\n")
+    print(f"{'step':<40}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err':>6}")
+    for step in sorted(stats.latencies):
+        v = stats.latencies[step]
+        print(f"{step:<40}{len(v):>6}{ms(percentile(v, 50))} {ms(percentile(v, 95))} "
+              f"{ms(percentile(v, 99))}{stats.errors.get(step, 0):>6}")
+    lag = stats.loop_lag
+    print(f"\n⏱️ Event-loop lag: p50 {percentile(lag, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(lag, 99) * 1000:.1f} ms, max {max(lag, default=0) * 1000:.1f} ms")
+    print(f"🧠 RSS: {_mb(rss0)} → {_mb(rss1)} (peak {_mb(stats.rss_peak)}, growth {_mb(rss1 - rss0)})")
+    print(f"💾 Temp disk: {_mb(disk0)} → {_mb(disk1)} (peak {_mb(stats.disk_peak)})")
+    print(f"📨 Replies: {client.responses}, files sent: {client.sent_files} ({_mb(client.sent_bytes)}), "
+          f"sessions left in memory: {sessions_left}")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Offline load test for the File Utility Bot handlers.")
+    ap.add_argument("--sessions", type=int, default=1000, help="simulated users (default 1000)")
+    ap.add_argument("--concurrency", type=int, default=100, help="users active at once (default 100)")
+    ap.add_argument("--fixtures", help="directory with sample files (default: generated)")
+    ap.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                    help="restrict to these scenarios (repeatable)")
+    ap.add_argument("--latency", type=float, default=0.0, help="fake network delay per call, ms")
+    ap.add_argument("--think", type=float, default=0.0, help="max user think time between steps, s")
+    ap.add_argument("--sample-interval", type=float, default=0.05, help="monitor interval, s")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--keep-tmp", action="store_true", help="leave the temp dir behind for inspection")
+    return ap.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run_load(parse_args())))
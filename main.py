@@ -1,4 +1,5 @@
 import os, io, asyncio, tempfile, time, shutil, traceback, threading, multiprocessing
+import cProfile, pstats, tracemalloc, subprocess, signal, contextlib
 from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Tuple
 
@@ -29,6 +30,7 @@ BOT_TOKEN = os.environ.get("BOT_TOKEN", "")
 OWNER_ID = int(os.environ.get("OWNER_ID", 0))
 BOT_USERNAME = os.environ.get("BOT_USERNAME", "FileUtilityBot")
 RENDER_URL = os.environ.get("RENDER_URL", "https://your-app.onrender.com")  # change to your Render URL
+UPLOAD_LIMIT_MB = int(os.environ.get("UPLOAD_LIMIT_MB", 2000))  # Telegram bot upload ceiling (MTProto: 2000 MiB)
 
 # init DB
 init_db()
@@ -229,6 +231,35 @@ async def broadcast_cmd(event):
     await event.respond(f"✅ Broadcast done.\n📨 Sent: {sent}\n❌ Failed: {failed}")
 
 
+# Owner-only profiling of the next N jobs
+@client.on(events.NewMessage(pattern=r"^/profile"))
+async def profile_cmd(event):
+    global PROFILE_JOBS_LEFT
+    if event.sender_id != OWNER_ID:
+        return await event.respond("❌ Only the bot owner can use this command.")
+    args = event.raw_text.split(" ", 1)
+    arg = args[1].strip().lower() if len(args) > 1 else ""
+    if not arg:
+        return await event.respond(
+            f"🔬 Profiling: {PROFILE_JOBS_LEFT} job(s) left.\n"
+            "⚠️ Usage: /profile <N> (next N jobs) or /profile off"
+        )
+    if arg in ("off", "0"):
+        PROFILE_JOBS_LEFT = 0
+        return await event.respond("✅ Profiling off.")
+    try:
+        n = int(arg)
+    except ValueError:
+        return await event.respond("⚠️ Usage: /profile <N> (next N jobs) or /profile off")
+    if n < 1:
+        return await event.respond("⚠️ N must be at least 1.")
+    PROFILE_JOBS_LEFT = min(n, PROFILE_MAX_JOBS)
+    await event.respond(
+        f"🔬 Profiling the next {PROFILE_JOBS_LEFT} job(s). "
+        "Reports (top functions, allocations, .prof file) will be sent here."
+    )
+
+
 # ---------------- FILE ENTRY ----------------
 @client.on(events.NewMessage(func=lambda e: e.file))
 async def on_file_unified(event):
@@ -281,7 +312,7 @@ async def on_text(event):
     if s.step == "await_split_ranges":
         try:
             await event.respond("⏳ Splitting...")
-            out = await asyncio.to_thread(split_pdf_by_ranges, s, text)
+            out = await run_job(event, split_pdf_by_ranges, s, text)
             for p, n in out:
                 await send_doc(event, p, n)
             s.step = "pdf_menu"
@@ -321,7 +352,7 @@ async def on_text(event):
         if low == "5":   # audio -> wav
             return await run_wrapper(event, convert_audio, s, "wav")
         if low == "6":   # video -> mp4
-            return await run_wrapper(event, convert_video, s, "mp4")
+            return await run_volume_wrapper(event, convert_video, s, "mp4")
         if low == "7":   # video -> gif
             return await run_wrapper(event, video_to_gif, s)
         if low == "8" or low == "back":
@@ -371,11 +402,127 @@ async def on_text(event):
         return await event.respond("❓ Send 1-3.")
 
 
+# ---------------- PROFILING (owner /profile) ----------------
+PROFILE_JOBS_LEFT = 0   # >0: the next N jobs run under cProfile + tracemalloc
+PROFILE_MAX_JOBS = 50
+PROFILE_TOP = 15
+
+# Profiled jobs run one at a time so they don't share tracemalloc's peak and
+# snapshots. Other threads keep allocating meanwhile, so the memory figures
+# are process-wide for the duration of the job.
+_PROFILE_LOCK = threading.Lock()
+_PROFILE_LOCAL = threading.local()  # .prof / .waited for the job on this thread
+
+
+@contextlib.contextmanager
+def profile_paused():
+    """Leave the enclosed blocking wait out of this thread's job profile."""
+    prof = getattr(_PROFILE_LOCAL, "prof", None)
+    if prof is None:
+        yield
+        return
+    prof.disable()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _PROFILE_LOCAL.waited += time.perf_counter() - t0
+        prof.enable()
+
+
+def profile_call(func, *args, **kwargs):
+    """Run func in the current (worker) thread under cProfile + tracemalloc.
+
+    Returns (result, error, prof_path, summary); the job's exception is
+    handed back instead of raised so the report is still produced."""
+    result, error = None, None
+    with _PROFILE_LOCK:
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        try:
+            before = tracemalloc.take_snapshot()
+            prof = cProfile.Profile()
+            _PROFILE_LOCAL.prof, _PROFILE_LOCAL.waited = prof, 0.0
+            t0 = time.perf_counter()
+            prof.enable()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            finally:
+                prof.disable()
+                _PROFILE_LOCAL.prof = None
+            elapsed = time.perf_counter() - t0
+            waited = _PROFILE_LOCAL.waited
+            _cur, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+    prof_path = safe_out_path("prof")
+    prof.dump_stats(prof_path)
+
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP)
+    lines = [ln for ln in buf.getvalue().splitlines() if ln.strip()]
+    # drop the pstats preamble, keep the header row onwards
+    for i, ln in enumerate(lines):
+        if ln.lstrip().startswith("ncalls"):
+            lines = lines[i:]
+            break
+
+    own = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    diff = after.filter_traces(own).compare_to(before.filter_traces(own), "lineno")
+    allocs = [str(st) for st in diff[:10]]
+
+    summary = (
+        f"🔬 **Profile: {func.__name__}** — {elapsed - waited:.2f}s profiled"
+        + (f" (+{waited:.2f}s waiting on uploads/ffmpeg, excluded)" if waited else "")
+        + f", peak traced {peak / (1024 * 1024):.1f} MB (process-wide)"
+        + (f", ❌ {type(error).__name__}" if error else "")
+        + "\n\n**Top functions (cumulative):**\n```\n" + "\n".join(lines) + "\n```"
+        + "\n**Top allocations (process-wide during the job, net, by line):**\n```\n" + ("\n".join(allocs) or "-") + "\n```"
+    )
+    return result, error, prof_path, summary
+
+
+async def send_profile_report(event, prof_path: str, summary: str):
+    try:
+        if len(summary) > 4000:  # Telegram message limit is 4096
+            summary = summary[:3990] + "\n…```"
+        await client.send_message(OWNER_ID, summary + f"\n👤 user {event.sender_id}, chat {event.chat_id}")
+        await client.send_file(OWNER_ID, prof_path, force_document=True, file_name="job.prof",
+                               caption="pstats file (python -m pstats job.prof / snakeviz)")
+    except Exception:
+        traceback.print_exc()
+    finally:
+        try:
+            os.remove(prof_path)
+        except OSError:
+            pass
+
+
+async def run_job(event, func, *args, **kwargs):
+    """Run a blocking job in a worker thread, profiled if /profile is armed."""
+    global PROFILE_JOBS_LEFT
+    if not PROFILE_JOBS_LEFT:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    PROFILE_JOBS_LEFT -= 1
+    out, err, prof_path, summary = await asyncio.to_thread(profile_call, func, *args, **kwargs)
+    await send_profile_report(event, prof_path, summary)
+    if err:
+        raise err
+    return out
+
+
 # ---------------- RUN WRAPPER ----------------
 async def run_wrapper(event, func, s: Session, *args, **kwargs):
     try:
         await event.respond("⏳ Working...")
-        out = await asyncio.to_thread(func, s, *args, **kwargs)
+        out = await run_job(event, func, s, *args, **kwargs)
         if isinstance(out, list):
             for p, n in out:
                 await send_doc(event, p, n)
@@ -391,6 +538,190 @@ async def run_wrapper(event, func, s: Session, *args, **kwargs):
         await event.respond(human_err(e) + "\nTry /cancel and re-start.")
 
 
+async def run_volume_wrapper(event, func, s: Session, *args):
+    """Like run_wrapper, for jobs that write their output through a VolumeSink."""
+    try:
+        await event.respond("⏳ Working...")
+        out = await stream_volumes(event, func, s, *args)
+        if isinstance(out, str):
+            await event.respond(out)
+    except Exception as e:
+        traceback.print_exc()
+        await event.respond(human_err(e) + "\nTry /cancel and re-start.")
+
+
+# ---------------- VOLUME OUTPUT ----------------
+UPLOAD_LIMIT = UPLOAD_LIMIT_MB * 1024 * 1024
+
+
+class VolumeSink:
+    """Hands closed output volumes from a job thread to the uploader.
+
+    emit() first waits for the previous volume's upload to finish, so disk
+    holds the volume being uploaded plus the one being written. The uploader
+    side waits on the event loop, never on an executor thread."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, limit: int = UPLOAD_LIMIT):
+        self.limit = limit
+        self.cancelled = False
+        self._loop = loop
+        self._q: "asyncio.Queue[Optional[Tuple[str, str]]]" = asyncio.Queue()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def emit(self, path: str, name: str):
+        with profile_paused():
+            self._idle.wait()
+        if self.cancelled:
+            _remove_quiet(path)
+            raise RuntimeError("Upload failed, output aborted.")
+        self._idle.clear()
+        self._loop.call_soon_threadsafe(self._deliver, (path, name))
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._deliver, None)
+
+    def _deliver(self, item: Optional[Tuple[str, str]]):
+        # runs on the loop, so it can't interleave with cancel()
+        if self.cancelled and item:
+            _remove_quiet(item[0])
+            return
+        self._q.put_nowait(item)
+
+    def cancel(self):
+        """Called on the loop when the uploader goes away: unblock the
+        producer so its next emit() fails, and drop queued volumes."""
+        self.cancelled = True
+        while not self._q.empty():
+            item = self._q.get_nowait()
+            if item:
+                _remove_quiet(item[0])
+        self._idle.set()
+
+    def busy(self) -> bool:
+        """True while the previously emitted volume is still uploading."""
+        return not self._idle.is_set()
+
+    async def get(self) -> Optional[Tuple[str, str]]:
+        return await self._q.get()
+
+    def task_done(self):
+        self._idle.set()
+
+
+class VolumeFile:
+    """Write-only stream that starts a new temp file every `sink.limit` bytes
+    and emits each one once it is full. Parts are plain byte splits
+    (name.001, name.002, ...); a single part keeps the plain name."""
+
+    def __init__(self, sink: VolumeSink, ext: str, name: str):
+        self.sink = sink
+        self.ext = ext
+        self.name = name
+        self.parts = 0
+        self._pos = 0
+        self._open_next()
+
+    def _open_next(self):
+        self._path = safe_out_path(self.ext)
+        self._fh = open(self._path, "wb")
+        self._size = 0
+
+    def _emit(self, name: str):
+        self._fh.close()
+        self.parts += 1
+        self.sink.emit(self._path, name)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        self._fh.flush()
+
+    def write(self, data) -> int:
+        view = memoryview(data).cast("B")
+        off = 0
+        while off < len(view):
+            room = self.sink.limit - self._size
+            if room <= 0:
+                self._emit(f"{self.name}.{self.parts + 1:03d}")
+                self._open_next()
+                continue
+            chunk = view[off:off + room]
+            self._fh.write(chunk)
+            self._size += len(chunk)
+            off += len(chunk)
+        self._pos += len(view)
+        return len(view)
+
+    def close(self):
+        self._emit(self.name if self.parts == 0 else f"{self.name}.{self.parts + 1:03d}")
+
+    def discard(self):
+        self._fh.close()
+        _remove_quiet(self._path)
+
+
+def part_name(stem: str, ext: str, index: int, single: bool) -> str:
+    """File name for the index-th (1-based) part; a lone part keeps the plain name."""
+    return f"{stem}.{ext}" if single else f"{stem}.part{index:02d}.{ext}"
+
+
+def _remove_quiet(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def stream_volumes(event, func, *args, caption: Optional[str] = None):
+    """Run func(sink, *args) as a job and upload every volume it emits as soon
+    as it is closed, deleting it afterwards. Returns func's result."""
+    sink = VolumeSink(asyncio.get_running_loop())
+
+    def produce():
+        try:
+            return func(sink, *args)
+        finally:
+            sink.close()
+    produce.__name__ = func.__name__
+
+    job = asyncio.create_task(run_job(event, produce))
+    error = None
+    try:
+        while True:
+            item = await sink.get()
+            if item is None:
+                break
+            path, name = item
+            try:
+                if not error:
+                    if os.path.getsize(path) > sink.limit:
+                        raise RuntimeError(f"{name} is larger than the {UPLOAD_LIMIT_MB} MB upload limit.")
+                    await send_doc(event, path, name, caption)
+            except Exception as e:
+                error = e
+                sink.cancelled = True
+            finally:
+                _remove_quiet(path)
+                sink.task_done()
+    except BaseException:
+        # e.g. the handler was cancelled mid-upload: nobody reads the queue
+        # any more, so stop the producer and still collect its outcome
+        sink.cancel()
+        job.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise
+    try:
+        out = await job
+    except Exception:
+        if error:
+            raise error
+        raise
+    if error:
+        raise error
+    return out
+
+
 # ---------------- FEATURE IMPLEMENTATIONS ----------------
 # Helpers
 
@@ -460,18 +791,85 @@ def convert_audio(s: Session, target: str):
 
 
 # Convert: Video -> MP4 (requires ffmpeg)
+# Encoded straight through ffmpeg's segment muxer so parts that fit the upload
+# limit can be sent while the rest is still encoding. ffmpeg is paused while a
+# finished part waits for the previous upload, so disk holds at most the part
+# being uploaded, the one waiting, and the one in progress.
+VIDEO_MAXRATE_KBPS = 8000
+AUDIO_KBPS = 192
+
 
-def convert_video(s: Session, target: str = "mp4"):
+def _read_segment_list(path: str) -> List[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [ln.split(",", 1)[0] for ln in f.read().splitlines() if ln.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def convert_video(sink: VolumeSink, s: Session, target: str = "mp4"):
     if not s.last_file_path:
         return "Send video first."
     if not ffmpeg_available():
         return "❌ ffmpeg not found on server. Install ffmpeg for audio/video features."
     src = s.last_file_path
-    out = safe_out_path(target)
-    clip = mp.VideoFileClip(src)
-    clip.write_videofile(out, codec="libx264", audio_codec="aac", verbose=False, logger=None)
-    clip.close()
-    return out, f"video.{target}"
+    # seconds per part at the capped bitrate, with 10% headroom for container overhead
+    seg = max(1, int(sink.limit * 8 * 0.9 / ((VIDEO_MAXRATE_KBPS + AUDIO_KBPS) * 1000)))
+    work = tempfile.mkdtemp(prefix="seg_", dir=TMP_ROOT)
+    listing = os.path.join(work, "parts.csv")
+    log_path = os.path.join(work, "ffmpeg.log")
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", src,
+        # yuv420p needs even dimensions; round odd sizes down by one pixel
+        "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p",
+        "-maxrate", f"{VIDEO_MAXRATE_KBPS}k", "-bufsize", f"{VIDEO_MAXRATE_KBPS * 2}k",
+        "-c:a", "aac", "-b:a", f"{AUDIO_KBPS}k",
+        "-force_key_frames", f"expr:gte(t,n_forced*{seg})",
+        "-f", "segment", "-segment_time", str(seg), "-reset_timestamps", "1",
+        "-segment_list", listing, "-segment_list_type", "csv",
+        os.path.join(work, f"part%03d.{target}"),
+    ]
+
+    # ffmpeg opens the second file as soon as the first segment closes with
+    # more input to come, which settles single vs. multi-part naming early
+    second = os.path.join(work, f"part001.{target}")
+    emitted = 0
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        while True:
+            running = proc.poll() is None
+            if not running and proc.returncode != 0:
+                # don't send parts from a failed encode; the last one may be truncated
+                with open(log_path, encoding="utf-8", errors="replace") as f:
+                    tail = f.read().strip().splitlines()[-1:] or ["ffmpeg failed"]
+                raise RuntimeError(tail[0])
+            done = _read_segment_list(listing)
+            for i in range(emitted, len(done)):
+                only = len(done) == 1 and not os.path.exists(second)
+                if only and running:
+                    break  # can't name the first part until we know if a second follows
+                out = safe_out_path(target)
+                os.replace(os.path.join(work, done[i]), out)
+                paused = running and sink.busy()
+                if paused:
+                    proc.send_signal(signal.SIGSTOP)
+                try:
+                    sink.emit(out, part_name("video", target, i + 1, only))
+                finally:
+                    if paused:
+                        proc.send_signal(signal.SIGCONT)
+                emitted += 1
+            if not running:
+                break
+            with profile_paused():
+                time.sleep(0.5)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        shutil.rmtree(work, ignore_errors=True)
 
 
 # Convert: Video -> GIF (requires ffmpeg)
@@ -540,18 +938,94 @@ def resave_pdf_maybe_smaller(s: Session):
 async def do_merge_pdfs(event, s: Session):
     if len(s.collected_paths) < 2:
         return await event.respond("Need at least 2 PDFs. Keep sending or /cancel.")
+    if not all(_is_pdf(p) for p in s.collected_paths):
+        return await event.respond("All files must be PDF. /cancel and retry.")
+    try:
+        await stream_volumes(event, merge_pdfs, s, caption="✅ Merged PDF")
+    except Exception as e:
+        traceback.print_exc()
+        reset_session(event)
+        return await event.respond(human_err(e) + "\nSession reset. Send the files again or /cancel.")
+    reset_session(event)
+    await event.respond(MAIN_MENU)
+
+
+def plan_pdf_parts(inputs: List[Tuple[str, int, int]], budget: float) -> List[List[Tuple[str, int, int]]]:
+    """Group (path, pages, size) inputs into parts of (path, start, end) page
+    ranges, spreading each file's size evenly over its pages. A part only
+    goes over budget when a single page does."""
+    plan: List[List[Tuple[str, int, int]]] = []
+    cur: List[Tuple[str, int, int]] = []
+    used = 0.0
+    for p, n, size in inputs:
+        per_page = size / max(n, 1)
+        start = 0
+        for i in range(n):
+            if used + per_page > budget and (cur or i > start):
+                if i > start:
+                    cur.append((p, start, i))
+                plan.append(cur)
+                cur, used, start = [], 0.0, i
+            used += per_page
+        if n > start:
+            cur.append((p, start, n))
+    if cur:
+        plan.append(cur)
+    return plan
+
+
+def _halve_part(part: List[Tuple[str, int, int]]):
+    """Split a part's page ranges into two halves by page count."""
+    half = sum(b - a for _, a, b in part) // 2
+    left: List[Tuple[str, int, int]] = []
+    right: List[Tuple[str, int, int]] = []
+    seen = 0
+    for p, a, b in part:
+        if seen + (b - a) <= half:
+            left.append((p, a, b))
+        elif seen >= half:
+            right.append((p, a, b))
+        else:
+            cut = a + half - seen
+            left.append((p, a, cut))
+            right.append((p, cut, b))
+        seen += b - a
+    return left, right
+
+
+def _write_pdf_part(part: List[Tuple[str, int, int]]) -> str:
     merger = PdfMerger()
-    for p in s.collected_paths:
-        if not _is_pdf(p):
-            return await event.respond("All files must be PDF. /cancel and retry.")
-        merger.append(p)
+    for p, a, b in part:
+        merger.append(p, pages=(a, b))
     out = safe_out_path("pdf")
     with open(out, "wb") as f:
         merger.write(f)
     merger.close()
-    await send_doc(event, out, "merged.pdf", "✅ Merged PDF")
-    reset_session(event)
-    await event.respond(MAIN_MENU)
+    return out
+
+
+def merge_pdfs(sink: VolumeSink, s: Session):
+    inputs = []
+    for p in s.collected_paths:
+        # only the page count is needed here; passing the open file keeps
+        # PdfReader from copying the whole input into memory
+        with open(p, "rb") as fh:
+            inputs.append((p, len(PdfReader(fh).pages), os.path.getsize(p)))
+    pending = plan_pdf_parts(inputs, sink.limit * 0.9)
+
+    # The plan is only an estimate (pages are rarely the same size), so each
+    # written part is measured and halved again until it fits; only a single
+    # page that is too big on its own is left for the uploader to reject.
+    idx = 0
+    while pending:
+        part = pending.pop(0)
+        out = _write_pdf_part(part)
+        if os.path.getsize(out) > sink.limit and sum(b - a for _, a, b in part) > 1:
+            _remove_quiet(out)
+            pending[:0] = _halve_part(part)
+            continue
+        idx += 1
+        sink.emit(out, part_name("merged", "pdf", idx, idx == 1 and not pending))
 
 
 # PDF: Split by ranges
@@ -615,16 +1089,35 @@ async def do_zip_create(event, s: Session):
     files = s.collected_paths[:] or ([s.last_file_path] if s.last_file_path else [])
     if not files:
         return await event.respond("Send files first.")
-    out = safe_out_path("zip")
-    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for p in files:
-            arcname = os.path.basename(p)
-            zf.write(p, arcname)
-    await send_doc(event, out, "archive.zip", "✅ ZIP created")
+    try:
+        parts = await stream_volumes(event, zip_files, files, caption="✅ ZIP created")
+    except Exception as e:
+        traceback.print_exc()
+        reset_session(event)
+        return await event.respond(human_err(e) + "\nSession reset. Send the files again or /cancel.")
+    if parts > 1:
+        await event.respond(
+            f"📦 Sent in {parts} parts. Join them with `cat archive.zip.* > archive.zip` "
+            "or open archive.zip.001 in 7-Zip."
+        )
     reset_session(event)
     await event.respond(MAIN_MENU)
 
 
+def zip_files(sink: VolumeSink, files: List[str]) -> int:
+    vf = VolumeFile(sink, "zip", "archive.zip")
+    try:
+        with zipfile.ZipFile(vf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for p in files:
+                arcname = os.path.basename(p)
+                zf.write(p, arcname)
+    except Exception:
+        vf.discard()
+        raise
+    vf.close()
+    return vf.parts
+
+
 # ZIP: Extract
 
 def unzip_archive(s: Session):
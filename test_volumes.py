@@ -0,0 +1,357 @@
+"""Checks for the multi-volume output helpers (run with pytest).
+
+main.py is imported through load_test's fakes, so no Telegram or DB is needed."""
+import asyncio, io, os, shutil, sys, tempfile, threading, types, zipfile
+import pytest
+
+
+@pytest.fixture(scope="module")
+def main():
+    """main.py loaded against the fakes; everything load_bot patches is put back."""
+    import telethon, db
+    from load_test import load_bot
+    saved = (telethon.TelegramClient, db.init_db, db.add_user, db.get_all_users, tempfile.tempdir)
+    workdir = tempfile.mkdtemp(prefix="test_volumes_")
+    try:
+        yield load_bot(workdir)
+    finally:
+        (telethon.TelegramClient, db.init_db, db.add_user, db.get_all_users, tempfile.tempdir) = saved
+        sys.modules.pop("main", None)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class FakeSink:
+    """Records emitted volumes instead of uploading them."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.volumes = []
+
+    def emit(self, path: str, name: str):
+        with open(path, "rb") as f:
+            self.volumes.append((name, f.read()))
+        os.remove(path)
+
+
+def _zip(main, sink, files):
+    parts = main.zip_files(sink, files)
+    assert parts == len(sink.volumes)
+    return b"".join(data for _, data in sink.volumes)
+
+
+def _inputs(tmp_path, sizes):
+    files = []
+    for i, size in enumerate(sizes):
+        p = tmp_path / f"f{i}.bin"
+        p.write_bytes(os.urandom(size))
+        files.append(str(p))
+    return files
+
+
+def test_zip_single_volume_keeps_plain_name(main, tmp_path):
+    sink = FakeSink(limit=1 << 20)
+    data = _zip(main, sink, _inputs(tmp_path, [100, 200]))
+    assert [name for name, _ in sink.volumes] == ["archive.zip"]
+    assert zipfile.ZipFile(io.BytesIO(data)).testzip() is None
+
+
+def test_zip_byte_split_rejoins(main, tmp_path):
+    sink = FakeSink(limit=1000)
+    files = _inputs(tmp_path, [2500, 700])
+    data = _zip(main, sink, files)
+    names = [name for name, _ in sink.volumes]
+    assert names == [f"archive.zip.{i:03d}" for i in range(1, len(names) + 1)]
+    assert len(names) > 1
+    # every part but the last is exactly limit bytes
+    assert all(len(d) == sink.limit for _, d in sink.volumes[:-1])
+    assert 0 < len(sink.volumes[-1][1]) <= sink.limit
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    assert zf.testzip() is None
+    for p in files:
+        with open(p, "rb") as f:
+            assert zf.read(os.path.basename(p)) == f.read()
+
+
+def test_zip_exact_multiple_has_no_empty_part(main, tmp_path):
+    sink = FakeSink(limit=1 << 20)
+    total = len(_zip(main, sink, _inputs(tmp_path, [3000])))
+    sink = FakeSink(limit=total)
+    _zip(main, sink, _inputs(tmp_path, [3000]))
+    assert [name for name, _ in sink.volumes] == ["archive.zip"]
+
+
+def test_part_name(main):
+    assert main.part_name("video", "mp4", 1, True) == "video.mp4"
+    assert main.part_name("video", "mp4", 3, False) == "video.part03.mp4"
+
+
+def test_plan_respects_budget(main):
+    inputs = [("a.pdf", 10, 1000), ("b.pdf", 5, 1500), ("c.pdf", 1, 50)]
+    plan = main.plan_pdf_parts(inputs, budget=450)
+    per_page = {"a.pdf": 100, "b.pdf": 300, "c.pdf": 50}
+    covered = {p: [] for p, _, _ in inputs}
+    for part in plan:
+        assert part
+        assert sum((b - a) * per_page[p] for p, a, b in part) <= 450
+        for p, a, b in part:
+            assert a < b
+            covered[p].extend(range(a, b))
+    # every page exactly once, in order
+    assert covered == {p: list(range(n)) for p, n, _ in inputs}
+
+
+def test_plan_single_part_and_oversized_page(main):
+    assert main.plan_pdf_parts([("a.pdf", 3, 300), ("b.pdf", 2, 200)], budget=1000) == [
+        [("a.pdf", 0, 3), ("b.pdf", 0, 2)]
+    ]
+    # a page bigger than the budget still gets its own part instead of looping
+    assert main.plan_pdf_parts([("big.pdf", 2, 2000)], budget=500) == [
+        [("big.pdf", 0, 1)], [("big.pdf", 1, 2)]
+    ]
+
+
+def test_merge_pdfs_splits_into_valid_parts(main, tmp_path):
+    from PyPDF2 import PdfReader, PdfWriter
+    paths = []
+    for i in range(2):
+        w = PdfWriter()
+        for _ in range(4):
+            w.add_blank_page(width=200, height=200)
+        p = tmp_path / f"in{i}.pdf"
+        with open(p, "wb") as f:
+            w.write(f)
+        paths.append(str(p))
+    sink = FakeSink(limit=os.path.getsize(paths[0]))  # about one input's worth
+    main.merge_pdfs(sink, main.Session(collected_paths=paths))
+    names = [n for n, _ in sink.volumes]
+    assert len(names) > 1
+    assert names == [f"merged.part{i:02d}.pdf" for i in range(1, len(names) + 1)]
+    assert all(len(d) <= sink.limit for _, d in sink.volumes)
+    pages = [len(PdfReader(io.BytesIO(d)).pages) for _, d in sink.volumes]
+    assert all(pages) and sum(pages) == 8
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_convert_video_segments(main, tmp_path):
+    import subprocess
+    src = tmp_path / "in.mp4"
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "lavfi",
+                    "-i", "testsrc=size=161x121:rate=25", "-t", "3", str(src)], check=True)
+    sink = FakeSink(limit=64 * 1024)  # 1 s segments
+    sink.busy = lambda: False
+    assert main.convert_video(sink, main.Session(last_file_path=str(src))) is None
+    names = [n for n, _ in sink.volumes]
+    assert names == [f"video.part{i:02d}.mp4" for i in range(1, len(names) + 1)]
+    assert len(names) >= 2
+
+
+def test_merge_pdfs_measures_uneven_pages(main, tmp_path):
+    # 5 heavy image pages then 5 blank ones: the even per-page estimate puts
+    # all images in one part, which must be measured and split again
+    from PIL import Image
+    from PyPDF2 import PdfReader, PdfWriter
+    w = PdfWriter()
+    for _ in range(5):
+        buf = io.BytesIO()
+        Image.frombytes("RGB", (200, 200), os.urandom(200 * 200 * 3)).save(buf, "PDF")
+        buf.seek(0)
+        w.add_page(PdfReader(buf).pages[0])
+    for _ in range(5):
+        w.add_blank_page(width=200, height=200)
+    src = tmp_path / "mixed.pdf"
+    with open(src, "wb") as f:
+        w.write(f)
+    sink = FakeSink(limit=int(os.path.getsize(src) * 0.6))
+    main.merge_pdfs(sink, main.Session(collected_paths=[str(src)]))
+    assert len(sink.volumes) > 1
+    assert all(len(d) <= sink.limit for _, d in sink.volumes)
+    assert [n for n, _ in sink.volumes] == [f"merged.part{i:02d}.pdf" for i in range(1, len(sink.volumes) + 1)]
+    assert sum(len(PdfReader(io.BytesIO(d)).pages) for _, d in sink.volumes) == 10
+
+
+@pytest.mark.parametrize("menu", [("3", "1"), ("4", "1")])
+def test_collect_done_reports_upload_errors(main, tmp_path, monkeypatch, menu):
+    from PyPDF2 import PdfWriter
+    from load_test import FakeEvent, FakeFile, FakeMessage, dispatch
+
+    w = PdfWriter()
+    w.add_blank_page(width=200, height=200)
+    pdf = tmp_path / "in.pdf"
+    with open(pdf, "wb") as f:
+        w.write(f)
+
+    async def failing_send(*args, **kwargs):
+        raise ConnectionError("upload broke")
+    monkeypatch.setattr(main.client, "send_file", failing_send)
+
+    def ev(text="", path=None):
+        msg = FakeMessage(raw_text=text, file=FakeFile("in.pdf") if path else None, fixture_path=path)
+        return FakeEvent(main.client, 77, 77, msg)
+
+    steps = [ev(path=str(pdf)), ev(menu[0]), ev(menu[1]), ev(path=str(pdf)), ev(path=str(pdf)), ev("done")]
+
+    async def run():
+        return [await dispatch(main.client, e) for e in steps]
+
+    # the only error is the ❌ reply; nothing escapes the handler
+    assert asyncio.run(run()) == [0, 0, 0, 0, 0, 1]
+    assert steps[-1].replies[-1].startswith("❌ Error: upload broke")
+    s = main.SESSIONS[(77, 77)]
+    assert s.step == "idle" and not s.collected_paths
+
+
+FAKE_FFMPEG = """#!/bin/sh
+# Stands in for ffmpeg's segment muxer: closes part000 (opening part001),
+# waits until the first part has been handed on, then finishes part001.
+for a; do last=$a; done
+work=$(dirname "$last")
+printf 0 > "$work/part000.mp4"
+printf 1 > "$work/part001.mp4"
+echo "part000.mp4,0,1" >> "$work/parts.csv"
+i=0
+while [ ! -e "$FAKE_FFMPEG_RELEASE" ]; do
+    i=$((i + 1)); [ $i -gt 100 ] && exit 3
+    sleep 0.1
+done
+echo "part001.mp4,1,2" >> "$work/parts.csv"
+echo "fake ffmpeg failure" >&2
+exit "${FAKE_FFMPEG_RC:-0}"
+"""
+
+
+def _run_fake_ffmpeg(main, tmp_path, monkeypatch, rc):
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    (bindir / "ffmpeg").write_text(FAKE_FFMPEG)
+    (bindir / "ffmpeg").chmod(0o755)
+    release = tmp_path / "release"
+    monkeypatch.setenv("PATH", f"{bindir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_FFMPEG_RELEASE", str(release))
+    monkeypatch.setenv("FAKE_FFMPEG_RC", str(rc))
+
+    sink = FakeSink(limit=1 << 20)
+    sink.busy = lambda: False
+    emit = sink.emit
+
+    def emit_and_release(path, name):
+        emit(path, name)
+        release.touch()  # ffmpeg only finishes part 2 once part 1 has gone out
+    sink.emit = emit_and_release
+    src = tmp_path / "in.mp4"
+    src.write_bytes(b"")
+    return sink, lambda: main.convert_video(sink, main.Session(last_file_path=str(src)))
+
+
+def test_convert_video_emits_first_part_while_encoding(main, tmp_path, monkeypatch):
+    sink, run = _run_fake_ffmpeg(main, tmp_path, monkeypatch, rc=0)
+    run()  # the fake exits 3 (-> RuntimeError) if part 1 was held back
+    assert [n for n, _ in sink.volumes] == ["video.part01.mp4", "video.part02.mp4"]
+
+
+def test_convert_video_drops_parts_after_ffmpeg_failure(main, tmp_path, monkeypatch):
+    sink, run = _run_fake_ffmpeg(main, tmp_path, monkeypatch, rc=1)
+    with pytest.raises(RuntimeError, match="fake ffmpeg failure"):
+        run()
+    assert [n for n, _ in sink.volumes] == ["video.part01.mp4"]
+
+
+# ---------------- stream_volumes / VolumeSink ----------------
+
+def _producer(main, count, size=10):
+    """Job that emits `count` small volumes; records what it made and how it ended."""
+    made, outcome = [], {}
+    finished = threading.Event()
+
+    def produce(sink):
+        outcome["sink"] = sink
+        try:
+            for i in range(count):
+                p = main.safe_out_path("bin")
+                with open(p, "wb") as f:
+                    f.write(b"x" * size)
+                made.append(p)
+                sink.emit(p, f"v{i}.bin")
+            outcome["result"] = "done"
+            return count
+        except BaseException as e:
+            outcome["error"] = e
+            raise
+        finally:
+            finished.set()
+    return produce, made, outcome, finished
+
+
+EVENT = types.SimpleNamespace(chat_id=1, sender_id=1)
+
+
+def test_stream_volumes_uploads_in_order_and_deletes(main, monkeypatch):
+    sent = []
+
+    async def send_file(chat_id, path, file_name=None, **kwargs):
+        with open(path, "rb") as f:
+            sent.append((file_name, f.read()))
+    monkeypatch.setattr(main.client, "send_file", send_file)
+    produce, made, _, _ = _producer(main, 3)
+    assert asyncio.run(main.stream_volumes(EVENT, produce)) == 3
+    assert [n for n, _ in sent] == ["v0.bin", "v1.bin", "v2.bin"]
+    assert not any(os.path.exists(p) for p in made)
+
+
+def test_stream_volumes_upload_failure_stops_producer(main, monkeypatch):
+    async def send_file(*args, **kwargs):
+        raise ConnectionError("upload broke")
+    monkeypatch.setattr(main.client, "send_file", send_file)
+    produce, made, outcome, finished = _producer(main, 50)
+    with pytest.raises(ConnectionError, match="upload broke"):
+        asyncio.run(main.stream_volumes(EVENT, produce))
+    assert finished.is_set()
+    assert isinstance(outcome.get("error"), RuntimeError)  # next emit() refused
+    assert len(made) <= 2
+    assert not any(os.path.exists(p) for p in made)
+
+
+def test_stream_volumes_rejects_oversize_volume(main, monkeypatch):
+    async def send_file(*args, **kwargs):
+        raise AssertionError("oversize volume must not be uploaded")
+    monkeypatch.setattr(main.client, "send_file", send_file)
+    produce, made, _, _ = _producer(main, 1, size=100)
+
+    def tiny(sink):
+        sink.limit = 10
+        return produce(sink)
+    with pytest.raises(RuntimeError, match="larger than"):
+        asyncio.run(main.stream_volumes(EVENT, tiny))
+    assert not any(os.path.exists(p) for p in made)
+
+
+def test_stream_volumes_cancel_releases_producer(main, monkeypatch):
+    # the uploader is cancelled mid-upload: the producer must not stay blocked
+    # in emit() and no volume may be left on disk
+    uploading = None
+
+    async def send_file(*args, **kwargs):
+        uploading.set()
+        await asyncio.sleep(3600)
+    monkeypatch.setattr(main.client, "send_file", send_file)
+    produce, made, outcome, finished = _producer(main, 50)
+
+    async def run():
+        nonlocal uploading
+        uploading = asyncio.Event()
+        task = asyncio.create_task(main.stream_volumes(EVENT, produce))
+        await uploading.wait()
+        await asyncio.sleep(0.1)  # let the producer queue its next volume
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        if not await asyncio.to_thread(finished.wait, 5):
+            # unstick the thread so the test fails instead of hanging on exit
+            outcome["sink"].cancelled = True
+            outcome["sink"].task_done()
+            pytest.fail("producer stuck in emit() after cancel")
+        await asyncio.sleep(0)  # let any late delivery run on the loop
+
+    asyncio.run(run())
+    assert isinstance(outcome.get("error"), RuntimeError)
+    assert len(made) <= 3
+    assert not any(os.path.exists(p) for p in made)